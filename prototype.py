@@ -1,8 +1,12 @@
 import os
+import re
+import argparse
 import datetime
+import hashlib
+import functools
 import logging
 from logging import Logger, Handler
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import requests
 import json
 
@@ -18,6 +22,151 @@ try:
 except ImportError:
     LogtailHandler = None  # type: ignore
 
+try:
+    import tiktoken  # type: ignore
+except ImportError:
+    tiktoken = None  # type: ignore
+
+
+@functools.lru_cache(maxsize=8)
+def _utc_timestamp(created_second: int) -> str:
+    """Render a record's creation second once; records in the same second share the string."""
+    return datetime.datetime.fromtimestamp(created_second, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+
+class CachingFormatter(logging.Formatter):
+    """Formatter that formats each record once and reuses the result across handlers."""
+
+    def format(self, record):
+        cached = getattr(record, "_formatted", None)
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        text = self.render(record)
+        record._formatted = (self, text)
+        return text
+
+    def render(self, record):
+        return super().format(record)
+
+
+class StructuredFormatter(CachingFormatter):
+    """Formatter that renders records as single-line JSON and keeps the entry for other sinks."""
+
+    def render(self, record):
+        entry = {
+            "dt": _utc_timestamp(int(record.created)),
+            "message": record.getMessage(),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        record.structured_entry = entry
+        return json.dumps(entry)
+
+
+class LogCostFilter(logging.Filter):
+    """Drop sampled-out DEBUG records and repeated messages before any handler formats them."""
+
+    # Upper bound on tracked message templates before expired windows are pruned
+    max_tracked_messages = 1024
+
+    def __init__(self, debug_sample_rates: Dict[str, float], rate_limit: int = 0, rate_window: float = 60.0):
+        super().__init__()
+        self.debug_sample_rates = debug_sample_rates
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.suppressed = {"sampled": 0, "rate_limited": 0}
+        self._debug_seen: Dict[str, int] = {}
+        self._recent: Dict[tuple, Tuple[float, int]] = {}
+
+    def _sample_rate(self, name):
+        # Longest matching logger prefix wins; "" holds the default rate
+        while True:
+            if name in self.debug_sample_rates:
+                return self.debug_sample_rates[name]
+            if not name:
+                return 1.0
+            name = name.rpartition(".")[0]
+
+    def filter(self, record):
+        # One instance is shared by every handler, so decide (and count) once per record
+        cached = getattr(record, "_cost_filter_keep", None)
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        keep = self._decide(record)
+        record._cost_filter_keep = (self, keep)
+        return keep
+
+    def _decide(self, record):
+        if record.levelno == logging.DEBUG:
+            rate = self._sample_rate(record.name)
+            if rate < 1.0:
+                # Fractional accumulator: keep a record each time seen * rate crosses an integer
+                seen = self._debug_seen.get(record.name, 0)
+                self._debug_seen[record.name] = seen + 1
+                if int(seen * rate) == int((seen + 1) * rate):
+                    self.suppressed["sampled"] += 1
+                    return False
+
+        if self.rate_limit > 0:
+            # Key on the unformatted template so repeats are caught without formatting;
+            # msg may be any object, so non-strings are keyed by their repr
+            msg = record.msg if isinstance(record.msg, str) else repr(record.msg)
+            key = (record.name, record.levelno, msg)
+            if key not in self._recent and len(self._recent) >= self.max_tracked_messages:
+                self._prune(record.created)
+            window_start, count = self._recent.get(key, (record.created, 0))
+            if record.created - window_start >= self.rate_window:
+                window_start, count = record.created, 0
+            self._recent[key] = (window_start, count + 1)
+            if count >= self.rate_limit:
+                self.suppressed["rate_limited"] += 1
+                return False
+        return True
+
+
+    def _prune(self, now):
+        # Drop expired windows first; if every window is live, drop the oldest entries
+        self._recent = {key: value for key, value in self._recent.items()
+                        if now - value[0] < self.rate_window}
+        while len(self._recent) >= self.max_tracked_messages:
+            self._recent.pop(next(iter(self._recent)))
+
+
+def env_number(name, default, cast=float):
+    """Read a non-negative number from env, warning and using default if it is malformed."""
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value = cast(raw.strip())
+        if not value >= 0:
+            raise ValueError(raw)
+        return value
+    except ValueError:
+        logging.getLogger(LOGGER_NAME).warning("Ignoring invalid %s=%r; using %s.", name, raw, default)
+        return default
+
+
+def parse_debug_sampling(value: str) -> Dict[str, float]:
+    """Parse LOG_DEBUG_SAMPLING, e.g. "0.5" or "readme_automation=0.1,0.5" (bare value is the default)."""
+    rates = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, rate = item.rpartition("=")
+        try:
+            parsed = float(rate)
+            if parsed != parsed:
+                raise ValueError(rate)
+        except ValueError:
+            logging.getLogger(LOGGER_NAME).warning("Ignoring invalid LOG_DEBUG_SAMPLING entry %r.", item)
+            continue
+        rates[name.strip()] = min(max(parsed, 0.0), 1.0)
+    return rates
+
 
 class BetterStackHandler(Handler):
     """Custom logging handler that sends logs to Better Stack using the direct API format."""
@@ -30,13 +179,16 @@ class BetterStackHandler(Handler):
     def emit(self, record):
         """Send log record to Better Stack."""
         try:
-            # Format the log message
-            log_entry = {
-                "dt": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"),
-                "message": self.format(record),
-                "level": record.levelname,
-                "logger": record.name
-            }
+            # Format the log message, reusing the structured entry if another sink built it
+            message = self.format(record)
+            log_entry = getattr(record, "structured_entry", None)
+            if log_entry is None:
+                log_entry = {
+                    "dt": _utc_timestamp(int(record.created)),
+                    "message": message,
+                    "level": record.levelname,
+                    "logger": record.name
+                }
             
             # Send to Better Stack
             response = requests.post(
@@ -58,18 +210,24 @@ class BetterStackHandler(Handler):
 
 _client = None
 LOGGER_NAME = "readme_automation"
+log_cost_filter = None
 
 
 def configure_logging() -> Logger:
     """Configure project-wide logging with console + optional Logtail sinks."""
+    global log_cost_filter
     log_level = os.getenv("LOG_LEVEL")
     if not log_level:
         log_level = "DEBUG" if os.getenv("CI") else "INFO"
     log_level = log_level.upper()
 
-    formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    )
+    # One shared formatter so each record is formatted once for all sinks
+    if os.getenv("LOG_FORMAT", "text").lower() == "structured":
+        formatter = StructuredFormatter()
+    else:
+        formatter = CachingFormatter(
+            "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+        )
 
     logger = logging.getLogger(LOGGER_NAME)
     logger.setLevel(log_level)
@@ -80,6 +238,15 @@ def configure_logging() -> Logger:
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
 
+    # Handler-level (not logger-level) so records from child loggers are filtered too;
+    # one shared instance keeps the suppression counters from double-counting
+    log_cost_filter = LogCostFilter(
+        debug_sample_rates=parse_debug_sampling(os.getenv("LOG_DEBUG_SAMPLING", "")),
+        rate_limit=env_number("LOG_RATE_LIMIT", 0, int),
+        rate_window=env_number("LOG_RATE_WINDOW", 60.0),
+    )
+    console_handler.addFilter(log_cost_filter)
+
     source_token = os.getenv("LOGTAIL_SOURCE_TOKEN")
     ci_active = os.getenv("CI")
     if source_token and not ci_active:
@@ -88,6 +255,7 @@ def configure_logging() -> Logger:
             betterstack_handler = BetterStackHandler(source_token=source_token)
             betterstack_handler.setLevel(log_level)
             betterstack_handler.setFormatter(formatter)
+            betterstack_handler.addFilter(log_cost_filter)
             logger.addHandler(betterstack_handler)
             logger.debug("Better Stack handler initialized for real-time monitoring.")
         except Exception as exc:
@@ -117,14 +285,186 @@ def get_openai_client():
         logger.debug("Reusing cached OpenAI client.")
     return _client
 
-def generate_readme(commits, existing_readme=""):
-    """Generates README content based on commit messages"""
+# Models tried in order; later tiers are only used when earlier output fails validation
+DEFAULT_MODEL_CASCADE = "gpt-4o-mini,gpt-4"
+METADATA_CATEGORIES = {"web-app", "cli-tool", "library", "automation", "devops", "data-science", "other"}
+README_MAX_TOKENS = 1200
+README_MIN_TOKENS = 400
+METADATA_MAX_TOKENS = 300
+_cascade_stats = {}
+_run_usage = {}
+
+
+def count_tokens(text, model="gpt-4") -> int:
+    """Count tokens locally with tiktoken, falling back to a ~4 characters per token estimate"""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            return len(encoding.encode(text))
+        except Exception as e:
+            logger.debug("tiktoken unavailable (%s); estimating tokens from length.", e)
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages, model="gpt-4") -> int:
+    """Count prompt tokens for chat messages, including per-message overhead"""
+    return sum(count_tokens(m["content"], model) + 4 for m in messages) + 3
+
+
+def record_run_usage(task, prompt_tokens, output_tokens, latency_ms):
+    """Accumulate this run's token usage and latency per task for track_metrics"""
+    usage = _run_usage.setdefault(task, {"attempts": 0, "prompt_tokens": 0, "output_tokens": 0, "latency_ms": 0})
+    usage["attempts"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["output_tokens"] += output_tokens
+    usage["latency_ms"] += latency_ms
+
+
+def _usage_tokens(response, field, fallback):
+    """Read a token count from the API usage block, or fall back to a local count"""
+    value = getattr(getattr(response, "usage", None), field, None)
+    return value if isinstance(value, int) else fallback
+
+
+def get_model_cascade() -> List[str]:
+    """Read the model cascade from MODEL_CASCADE (comma-separated, cheapest first)"""
+    models = [m.strip() for m in os.getenv("MODEL_CASCADE", DEFAULT_MODEL_CASCADE).split(",") if m.strip()]
+    return models or DEFAULT_MODEL_CASCADE.split(",")
+
+
+def record_cascade_attempt(task, model, latency_ms, accepted):
+    """Record one cascade tier attempt for per-tier hit rate and latency tracking"""
+    tier = _cascade_stats.setdefault(task, {}).setdefault(
+        model, {"attempts": 0, "hits": 0, "total_latency_ms": 0}
+    )
+    tier["attempts"] += 1
+    tier["total_latency_ms"] += latency_ms
+    if accepted:
+        tier["hits"] += 1
+
+
+# Sections every generated README must contain, matched against its headings
+README_REQUIRED_SECTIONS = {
+    "features": re.compile(r"feature", re.IGNORECASE),
+    "setup/installation": re.compile(r"install|setup|getting started|quick ?start", re.IGNORECASE),
+}
+
+
+def readme_max_tokens(commits, existing_readme=""):
+    """Scale the README output budget with the input: existing README plus room for new commits"""
+    # A README written from scratch needs every section the prompt asks for
+    if not existing_readme.strip():
+        return README_MAX_TOKENS
+    estimate = count_tokens(existing_readme) + 40 * len(commits) + 200
+    return max(README_MIN_TOKENS, min(README_MAX_TOKENS, estimate))
+
+
+def validate_readme_output(content):
+    """Quality gate for README output: title, required sections and balanced code fences"""
+    if not content:
+        raise ValueError("README output is empty")
+    headings = re.findall(r"^#{1,6} +(.+)$", content, re.MULTILINE)
+    if not re.search(r"^# +\S", content, re.MULTILINE):
+        raise ValueError("README output has no top-level title")
+    missing = [name for name, pattern in README_REQUIRED_SECTIONS.items()
+               if not any(pattern.search(heading) for heading in headings)]
+    if missing:
+        raise ValueError(f"README output is missing section(s): {', '.join(missing)}")
+    # Only fence lines count; inline backticks in prose do not open a block
+    fences = [line for line in content.splitlines() if line.lstrip().startswith("```")]
+    if len(fences) % 2:
+        raise ValueError("README output has an unclosed code block")
+    return content
+
+
+def parse_metadata_json(content):
+    """Parse metadata JSON from model output, stripping a markdown code block if present"""
+    if content.startswith("```"):
+        content = content.split("```")[1]
+        if content.startswith("json"):
+            content = content[4:]
+    metadata = json.loads(content.strip())
+    if not isinstance(metadata, dict):
+        raise ValueError("metadata is not a JSON object")
+    return metadata
+
+
+def parse_metadata_output(content):
+    """Quality gate for metadata output: parse the JSON and check it matches the expected schema"""
+    metadata = parse_metadata_json(content)
+    for key in ("tags", "tech_stack"):
+        if not isinstance(metadata.get(key), list) or not all(isinstance(v, str) for v in metadata[key]):
+            raise ValueError(f"metadata field '{key}' must be a list of strings")
+    for key in ("category", "project_type", "primary_language", "description"):
+        if not isinstance(metadata.get(key), str) or not metadata[key].strip():
+            raise ValueError(f"metadata field '{key}' must be a non-empty string")
+    if metadata["category"] not in METADATA_CATEGORIES:
+        raise ValueError(f"metadata category '{metadata['category']}' is not allowed")
+    return metadata
+
+
+def complete_with_cascade(task, messages, validate, max_tokens, temperature, fallback=None):
+    """Run a chat completion through the model cascade, escalating when validation fails.
+
+    If the last tier's output fails validation, it is passed through ``fallback``
+    (when given) instead of being discarded; only API errors or a failing fallback raise.
+    Returns (output, model, latency_ms) where latency covers all tiers tried.
+    """
+    client = get_openai_client()
+    models = get_model_cascade()
+    total_latency_ms = 0
+    last_error = None
+    for index, model in enumerate(models):
+        start_time = datetime.datetime.now()
+        response = None
+        content = None
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            content = response.choices[0].message.content.strip()
+            if getattr(response.choices[0], "finish_reason", None) == "length":
+                raise ValueError("output was truncated at max_tokens")
+            result = validate(content)
+            accepted = True
+        except Exception as e:
+            last_error = e
+            accepted = False
+        latency_ms = int((datetime.datetime.now() - start_time).total_seconds() * 1000)
+        total_latency_ms += latency_ms
+        record_cascade_attempt(task, model, latency_ms, accepted)
+        if response is not None:
+            record_run_usage(
+                task,
+                _usage_tokens(response, "prompt_tokens", count_message_tokens(messages, model)),
+                _usage_tokens(response, "completion_tokens", count_tokens(content or "", model)),
+                latency_ms,
+            )
+        if accepted:
+            logger.debug("%s accepted from %s (%d ms).", task, model, latency_ms)
+            return result, model, total_latency_ms
+        if index + 1 < len(models):
+            logger.warning("%s from %s failed quality gate: %s; escalating to %s.",
+                           task, model, last_error, models[index + 1])
+        elif content is not None and fallback is not None:
+            logger.warning("%s from %s (last tier) failed quality gate: %s; using its output anyway.",
+                           task, model, last_error)
+            return fallback(content), model, total_latency_ms
+        else:
+            logger.warning("%s from %s (last tier) failed: %s.", task, model, last_error)
+    raise last_error
+
+def build_readme_messages(commits, existing_readme=""):
+    """Build the chat messages used to generate README content"""
     commit_summary = "\n".join([f"- {commit}" for commit in commits])
-    logger.info("Generating README from %d commit(s).", len(commits))
-    if existing_readme.strip():
-        logger.debug("Existing README context detected (%d chars).", len(existing_readme))
-    else:
-        logger.debug("No existing README context provided.")
     
     # Build the prompt with existing README context
     if existing_readme.strip():
@@ -159,19 +499,29 @@ def generate_readme(commits, existing_readme=""):
     5. Usage examples if relevant
     Format the response in proper Markdown.
     """
+    return [
+        {"role": "system", "content": "You are a helpful assistant that generates README content from commit messages."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_readme(commits, existing_readme=""):
+    """Generates README content based on commit messages"""
+    logger.info("Generating README from %d commit(s).", len(commits))
+    if existing_readme.strip():
+        logger.debug("Existing README context detected (%d chars).", len(existing_readme))
+    else:
+        logger.debug("No existing README context provided.")
     
     try:
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates README content from commit messages."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1200,
+        content, _, _ = complete_with_cascade(
+            "readme",
+            messages=build_readme_messages(commits, existing_readme),
+            validate=validate_readme_output,
+            max_tokens=readme_max_tokens(commits, existing_readme),
             temperature=0.7,
+            fallback=lambda content: content,
         )
-        return response.choices[0].message.content.strip()
+        return content
     except Exception as e:
         logger.error("Error generating README content: %s", e)
         return f"Error generating README: {str(e)}"
@@ -230,8 +580,8 @@ def parse_commit(commit):
         "content": content
     }
 
-def generate_project_metadata(commits, file_count, file_names):
-    """Generate structured project metadata using ML (Task #1 enhancement)"""
+def build_metadata_messages(commits, file_count, file_names):
+    """Build the chat messages used to generate structured project metadata"""
     commit_summary = "\n".join([f"- {commit}" for commit in commits[:20]])  # Limit for prompt size
     file_extensions = set()
     for file_list in file_names:
@@ -269,42 +619,34 @@ Rules:
 - description: one sentence describing the project
 
 Return ONLY the JSON, no markdown, no explanations."""
+    return [
+        {"role": "system", "content": "You are a helpful assistant that generates structured project metadata. Always return valid JSON only."},
+        {"role": "user", "content": prompt}
+    ]
 
+def generate_project_metadata(commits, file_count, file_names):
+    """Generate structured project metadata using ML (Task #1 enhancement)"""
     try:
-        start_time = datetime.datetime.now()
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates structured project metadata. Always return valid JSON only."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300,
+        metadata, model, latency_ms = complete_with_cascade(
+            "metadata",
+            messages=build_metadata_messages(commits, file_count, file_names),
+            validate=parse_metadata_output,
+            max_tokens=METADATA_MAX_TOKENS,
             temperature=0.3,  # Lower temperature for more consistent structured output
+            fallback=parse_metadata_json,
         )
         
-        latency_ms = int((datetime.datetime.now() - start_time).total_seconds() * 1000)
-        content = response.choices[0].message.content.strip()
-        
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        content = content.strip()
-        
-        metadata = json.loads(content)
         metadata["ml_generated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        metadata["ml_model"] = "gpt-4"
+        metadata["ml_model"] = model
         metadata["ml_latency_ms"] = latency_ms
         metadata["ml_status"] = "success"
         metadata["ml_prompt_version"] = "v1"
         
-        logger.info("Generated project metadata successfully (latency: %d ms).", latency_ms)
+        logger.info("Generated project metadata successfully with %s (latency: %d ms).", model, latency_ms)
         return metadata
         
-    except json.JSONDecodeError as e:
-        logger.error("Failed to parse ML metadata JSON: %s. Raw response: %s", e, content[:200])
+    except ValueError as e:
+        logger.error("Failed to produce valid ML metadata: %s", e)
         return {
             "tags": ["automation", "readme"],
             "category": "automation",
@@ -377,18 +719,86 @@ def save_metadata(metadata, filepath="project_metadata.json"):
         logger.error("Error saving metadata: %s", e)
         return False
 
-def auto_commit_changes(repo_path, files_to_commit, commit_message):
-    """Auto-commit changes to git repository (Task #1: taking action)"""
+# Fields that change on every run without reflecting a meaningful update
+VOLATILE_LINE_PATTERNS = [
+    re.compile(r"^last updated:.*$", re.IGNORECASE | re.MULTILINE),
+    re.compile(r"^\*Metadata generated by AI on .*\*$", re.MULTILINE),
+]
+VOLATILE_JSON_KEYS = {"ml_generated_at", "last_updated", "timestamp", "ml_latency_ms", "generation_history"}
+
+
+def _strip_volatile_json(value):
+    """Recursively drop volatile keys from parsed JSON"""
+    if isinstance(value, dict):
+        return {k: _strip_volatile_json(v) for k, v in value.items() if k not in VOLATILE_JSON_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile_json(v) for v in value]
+    return value
+
+
+def content_fingerprint(content: bytes, filename: str = "") -> str:
+    """Hash file content with volatile fields (timestamps, latencies, history) ignored"""
+    text = content.decode("utf-8", errors="replace")
+    if filename.endswith(".json"):
+        try:
+            data = _strip_volatile_json(json.loads(text))
+            text = json.dumps(data, sort_keys=True)
+        except json.JSONDecodeError:
+            pass
+    for pattern in VOLATILE_LINE_PATTERNS:
+        text = pattern.sub("", text)
+    text = "\n".join(line.rstrip() for line in text.strip().splitlines())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _read_committed_file(repo, rel_path) -> Optional[bytes]:
+    """Read a file's content at HEAD, or None if it is not committed yet"""
+    try:
+        return (repo.head.commit.tree / rel_path).data_stream.read()
+    except (ValueError, KeyError):
+        return None
+
+
+def get_meaningful_changes(repo, files_to_commit) -> List[str]:
+    """Return repo-relative paths whose content differs from HEAD beyond volatile fields"""
+    changed = []
+    for file in files_to_commit:
+        if not os.path.exists(file):
+            continue
+        rel_path = os.path.relpath(os.path.abspath(file), repo.working_tree_dir).replace(os.sep, "/")
+        with open(file, "rb") as f:
+            current = f.read()
+        committed = _read_committed_file(repo, rel_path)
+        if committed is not None and content_fingerprint(current, rel_path) == content_fingerprint(committed, rel_path):
+            logger.debug("No meaningful changes in %s; skipping.", rel_path)
+            continue
+        changed.append(rel_path)
+    return changed
+
+
+def auto_commit_changes(repo_path, files_to_commit, commit_message, extra_files=None):
+    """Auto-commit changes to git repository (Task #1: taking action)
+
+    extra_files are staged alongside meaningful changes but never trigger a commit on their own.
+    """
     try:
         repo = git.Repo(repo_path)
         
-        # Check if there are changes
-        if repo.is_dirty() or repo.untracked_files:
-            # Add files
-            for file in files_to_commit:
-                if os.path.exists(file):
-                    repo.index.add([file])
-                    logger.debug("Staged file: %s", file)
+        # Only inspect the files being committed instead of scanning the whole tree
+        changed_files = get_meaningful_changes(repo, files_to_commit)
+        if changed_files:
+            for file in extra_files or []:
+                if not os.path.exists(file):
+                    continue
+                rel_path = os.path.relpath(os.path.abspath(file), repo.working_tree_dir)
+                # Files kept outside the repo (e.g. a persisted metrics file) cannot be staged
+                if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep) or os.path.isabs(rel_path):
+                    logger.debug("Not staging %s: outside the working tree.", file)
+                    continue
+                changed_files.append(rel_path.replace(os.sep, "/"))
+            # Stage everything in a single index write
+            repo.index.add(changed_files)
+            logger.debug("Staged file(s): %s", ", ".join(changed_files))
             
             # Create commit
             commit = repo.index.commit(commit_message)
@@ -405,36 +815,84 @@ def auto_commit_changes(repo_path, files_to_commit, commit_message):
             
             return True, commit.hexsha
         else:
-            logger.debug("No changes to commit.")
+            logger.debug("No meaningful changes to commit.")
             return False, None
             
     except Exception as e:
         logger.error("Error auto-committing changes: %s", e)
         return False, None
 
+def get_metrics_file():
+    """Path of the metrics file; set ML_METRICS_FILE to a location that persists between runs"""
+    return os.getenv("ML_METRICS_FILE") or "ml_metrics.json"
+
+def load_metrics(metrics_file=None):
+    """Load recorded ML metrics, or an empty baseline if none exist yet"""
+    metrics_file = metrics_file or get_metrics_file()
+    metrics = {
+        "total_generations": 0,
+        "successful_generations": 0,
+        "failed_generations": 0,
+        "avg_latency_ms": 0,
+        "last_updated": None
+    }
+    
+    if os.path.exists(metrics_file):
+        try:
+            with open(metrics_file, "r") as f:
+                saved = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning("Ignoring unreadable metrics file %s: %s", metrics_file, e)
+            return metrics
+        if not isinstance(saved, dict):
+            logger.warning("Ignoring metrics file %s: expected a JSON object.", metrics_file)
+            return metrics
+        metrics = saved
+    return metrics
+
 def track_metrics(metadata, readme_success=True):
     """Track ML generation metrics"""
-    metrics_file = "ml_metrics.json"
+    metrics_file = get_metrics_file()
     
     try:
-        metrics = {
-            "total_generations": 0,
-            "successful_generations": 0,
-            "failed_generations": 0,
-            "avg_latency_ms": 0,
-            "last_updated": None
-        }
-        
-        if os.path.exists(metrics_file):
-            with open(metrics_file, "r") as f:
-                metrics = json.load(f)
+        metrics = load_metrics(metrics_file)
         
         metrics["total_generations"] += 1
-        if metadata.get("ml_status") == "success" and readme_success:
+        if metadata.get("ml_status") in ("success", "cached") and readme_success:
             metrics["successful_generations"] += 1
         else:
             metrics["failed_generations"] += 1
         
+        # Merge per-tier cascade hit rates and latencies
+        cascade = metrics.setdefault("cascade", {})
+        for task, tiers in _cascade_stats.items():
+            for model, stats in tiers.items():
+                tier = cascade.setdefault(task, {}).setdefault(
+                    model, {"attempts": 0, "hits": 0, "total_latency_ms": 0}
+                )
+                tier["attempts"] += stats["attempts"]
+                tier["hits"] += stats["hits"]
+                tier["total_latency_ms"] += stats["total_latency_ms"]
+                tier["hit_rate"] = round(tier["hits"] / tier["attempts"], 3)
+                tier["avg_latency_ms"] = int(tier["total_latency_ms"] / tier["attempts"])
+        _cascade_stats.clear()
+        
+        # Record per-task token usage and latency for the pre-flight planner
+        today = datetime.date.today().isoformat()
+        daily = metrics.get("daily", {})
+        if daily.get("date") != today:
+            daily = {"date": today, "tokens": 0, "latency_ms": 0}
+        tasks = metrics.setdefault("tasks", {})
+        for task, usage in _run_usage.items():
+            totals = tasks.setdefault(task, {"runs": 0, "prompt_tokens": 0, "output_tokens": 0, "latency_ms": 0})
+            totals["runs"] += 1
+            for key in ("attempts", "prompt_tokens", "output_tokens", "latency_ms"):
+                totals[key] = totals.get(key, 0) + usage[key]
+            daily["tokens"] += usage["prompt_tokens"] + usage["output_tokens"]
+            daily["latency_ms"] += usage["latency_ms"]
+        metrics["daily"] = daily
+        _run_usage.clear()
+        
         # Update average latency
         if metadata.get("ml_latency_ms"):
             current_avg = metrics.get("avg_latency_ms", 0)
@@ -454,7 +912,189 @@ def track_metrics(metadata, readme_success=True):
     except Exception as e:
         logger.warning("Error tracking metrics: %s", e)
 
+# USD per 1K tokens (prompt, completion), used for pre-flight cost estimates
+MODEL_PRICING_PER_1K = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4": (0.03, 0.06),
+}
+DEFAULT_MS_PER_OUTPUT_TOKEN = 25
+# Assumed chance a tier passes the quality gate before any runs are recorded
+DEFAULT_TIER_HIT_RATE = 0.5
+MIN_PLAN_COMMITS = 10
+
+
+def get_run_budgets():
+    """Read per-run and per-day budgets from env; 0 or unset means unlimited"""
+    return {
+        "run_tokens": env_number("RUN_TOKEN_BUDGET", 0, int),
+        "run_seconds": env_number("RUN_TIME_BUDGET_S", 0.0),
+        "daily_tokens": env_number("DAILY_TOKEN_BUDGET", 0, int),
+        "daily_seconds": env_number("DAILY_TIME_BUDGET_S", 0.0),
+    }
+
+def remaining_budget(budgets, metrics):
+    """Combine run budgets with what is left of today's budgets; None means unlimited"""
+    daily = metrics.get("daily", {})
+    used_today = daily if daily.get("date") == datetime.date.today().isoformat() else {}
+    token_limits = []
+    latency_limits = []
+    if budgets["run_tokens"]:
+        token_limits.append(budgets["run_tokens"])
+    if budgets["daily_tokens"]:
+        token_limits.append(max(0, budgets["daily_tokens"] - used_today.get("tokens", 0)))
+    if budgets["run_seconds"]:
+        latency_limits.append(int(budgets["run_seconds"] * 1000))
+    if budgets["daily_seconds"]:
+        latency_limits.append(max(0, int(budgets["daily_seconds"] * 1000) - used_today.get("latency_ms", 0)))
+    return (min(token_limits) if token_limits else None,
+            min(latency_limits) if latency_limits else None)
+
+def estimate_step(task, messages, max_tokens, metrics):
+    """Estimate tokens, latency and cost of one generation step from local counts and past runs.
+
+    Each cascade tier is weighted by the chance of reaching it, using the hit rates
+    recorded under metrics["cascade"].
+    """
+    models = get_model_cascade()
+    history = metrics.get("tasks", {}).get(task, {})
+    attempts = history.get("attempts") or history.get("runs", 0)
+    # Without history assume the worst case: the model uses its full max_tokens
+    output_tokens = min(max_tokens, int(history["output_tokens"] / attempts)) if attempts else max_tokens
+    if attempts and history.get("output_tokens"):
+        ms_per_token = history["latency_ms"] / history["output_tokens"]
+    else:
+        ms_per_token = DEFAULT_MS_PER_OUTPUT_TOKEN
+    
+    tiers = metrics.get("cascade", {}).get(task, {})
+    reach = 1.0
+    escalation_rate = 0.0
+    expected = {"prompt_tokens": 0.0, "output_tokens": 0.0, "latency_ms": 0.0, "cost_usd": 0.0}
+    for index, model in enumerate(models):
+        tier = tiers.get(model, {})
+        prompt_tokens = count_message_tokens(messages, model)
+        latency_ms = tier["total_latency_ms"] / tier["attempts"] if tier.get("attempts") else output_tokens * ms_per_token
+        prompt_price, output_price = MODEL_PRICING_PER_1K.get(model, MODEL_PRICING_PER_1K["gpt-4"])
+        expected["prompt_tokens"] += reach * prompt_tokens
+        expected["output_tokens"] += reach * output_tokens
+        expected["latency_ms"] += reach * latency_ms
+        expected["cost_usd"] += reach * (prompt_tokens * prompt_price + output_tokens * output_price) / 1000
+        if index + 1 < len(models):
+            hit_rate = tier["hits"] / tier["attempts"] if tier.get("attempts") else DEFAULT_TIER_HIT_RATE
+            reach *= 1 - hit_rate
+            if index == 0:
+                escalation_rate = reach
+    
+    return {
+        "model": models[0],
+        "escalation_rate": escalation_rate,
+        "prompt_tokens": int(round(expected["prompt_tokens"])),
+        "output_tokens": int(round(expected["output_tokens"])),
+        "latency_ms": int(expected["latency_ms"]),
+        "cost_usd": expected["cost_usd"],
+    }
+
+def plan_run(commits, existing_readme, file_count, file_names, metrics=None, budgets=None):
+    """Estimate a run before calling the API and degrade it until it fits the budgets.
+
+    Degradation order: trim commit history, reuse cached metadata, reuse the existing README.
+    """
+    metrics = load_metrics() if metrics is None else metrics
+    budgets = get_run_budgets() if budgets is None else budgets
+    token_limit, latency_limit = remaining_budget(budgets, metrics)
+    skip_metadata = False
+    skip_readme = False
+    degradations = []
+    
+    while True:
+        steps = {}
+        if not skip_readme:
+            steps["readme"] = estimate_step(
+                "readme", build_readme_messages(commits, existing_readme),
+                readme_max_tokens(commits, existing_readme), metrics
+            )
+        if not skip_metadata:
+            steps["metadata"] = estimate_step(
+                "metadata", build_metadata_messages(commits, file_count, file_names), METADATA_MAX_TOKENS, metrics
+            )
+        total_tokens = sum(step["prompt_tokens"] + step["output_tokens"] for step in steps.values())
+        total_latency_ms = sum(step["latency_ms"] for step in steps.values())
+        within_budget = ((token_limit is None or total_tokens <= token_limit)
+                         and (latency_limit is None or total_latency_ms <= latency_limit))
+        if within_budget:
+            break
+        if len(commits) > MIN_PLAN_COMMITS:
+            commits = commits[:max(MIN_PLAN_COMMITS, len(commits) // 2)]
+            degradations.append(f"trimmed commit history to {len(commits)} commit(s)")
+        elif not skip_metadata:
+            skip_metadata = True
+            degradations.append("skipped metadata generation; reusing cached metadata")
+        elif not skip_readme and existing_readme.strip():
+            skip_readme = True
+            degradations.append("skipped README generation; reusing existing README")
+        else:
+            break
+    
+    return {
+        "commits": commits,
+        "steps": steps,
+        "skip_readme": skip_readme,
+        "skip_metadata": skip_metadata,
+        "total_tokens": total_tokens,
+        "total_latency_ms": total_latency_ms,
+        "total_cost_usd": sum(step["cost_usd"] for step in steps.values()),
+        "token_limit": token_limit,
+        "latency_limit_ms": latency_limit,
+        "degradations": degradations,
+        "within_budget": within_budget,
+    }
+
+def format_plan(plan):
+    """Render a run plan as a human-readable report"""
+    lines = [f"Run plan (model cascade: {', '.join(get_model_cascade())})"]
+    for task, step in plan["steps"].items():
+        lines.append(
+            f"  {task}: {step['model']}, ~{step['prompt_tokens']} prompt + ~{step['output_tokens']} output tokens, "
+            f"~{step['latency_ms'] / 1000:.1f}s, ~${step['cost_usd']:.4f} "
+            f"(~{step['escalation_rate']:.0%} escalate)"
+        )
+    lines.append(
+        f"  total: ~{plan['total_tokens']} tokens, ~{plan['total_latency_ms'] / 1000:.1f}s, "
+        f"~${plan['total_cost_usd']:.4f} across {len(plan['commits'])} commit(s)"
+    )
+    token_limit = plan["token_limit"]
+    latency_limit = plan["latency_limit_ms"]
+    lines.append(
+        f"  budget: tokens {token_limit if token_limit is not None else 'unlimited'}, "
+        f"time {f'{latency_limit / 1000:.1f}s' if latency_limit is not None else 'unlimited'}"
+    )
+    for step in plan["degradations"]:
+        lines.append(f"  degraded: {step}")
+    lines.append(f"  within budget: {'yes' if plan['within_budget'] else 'no'}")
+    return "\n".join(lines)
+
+def load_cached_metadata(filepath="project_metadata.json"):
+    """Reuse the last saved project metadata instead of calling the API"""
+    try:
+        with open(filepath, "r") as f:
+            saved = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+    if not isinstance(saved, dict) or not saved.get("tags"):
+        return None
+    
+    metadata = {key: saved.get(key) for key in
+                ("tags", "category", "project_type", "tech_stack", "primary_language", "description", "ml_model")}
+    metadata["ml_status"] = "cached"
+    metadata["ml_generated_at"] = saved.get("last_updated")
+    return metadata
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auto-generate README and project metadata from commits.")
+    parser.add_argument("--plan", action="store_true",
+                        help="print the estimated tokens, latency and cost without calling the API")
+    args = parser.parse_args()
+    
     # Determine repo path (GitHub Actions uses /github/workspace, local uses .)
     logger.info("Starting README automation run.")
     repo_path = os.getenv("GITHUB_WORKSPACE") or "."
@@ -495,17 +1135,43 @@ if __name__ == "__main__":
     except FileNotFoundError:
         pass
     
+    # Pre-flight plan: estimate tokens, latency and cost, degrading to stay within budgets
+    plan = plan_run(commits, existing_readme, count, names)
+    if args.plan:
+        print(format_plan(plan))
+        raise SystemExit(0)
+    logger.info("Planned run: ~%d tokens, ~%d ms, ~$%.4f.",
+                plan["total_tokens"], plan["total_latency_ms"], plan["total_cost_usd"])
+    for step in plan["degradations"]:
+        logger.warning("Run budget exceeded; %s.", step)
+    if not plan["within_budget"]:
+        if os.getenv("ALLOW_OVER_BUDGET") == "true":
+            logger.warning("Run is still estimated to exceed its budget; proceeding (ALLOW_OVER_BUDGET=true).")
+        else:
+            # Keep the existing README and metadata untouched rather than blowing the budget
+            logger.warning("Run is still estimated to exceed its budget after degrading; "
+                           "skipping generation and keeping existing output.")
+            raise SystemExit(0)
+    commits = plan["commits"]
+    
     # Generate README content with context from existing README
-    readme_start_time = datetime.datetime.now()
-    readme_content = generate_readme(commits, existing_readme)
+    if plan["skip_readme"]:
+        # Drop the previous metadata section; it is re-appended below
+        readme_content = existing_readme.split("\n## Project Metadata (AI-Generated)")[0].rstrip()
+    else:
+        readme_content = generate_readme(commits, existing_readme)
     readme_success = not readme_content.startswith("Error")
     
     # Generate structured project metadata (Task #1: Enhanced ML)
-    logger.info("Generating structured project metadata using ML...")
-    metadata = generate_project_metadata(commits, count, names)
-    
-    # Save metadata to file (Task #1: taking action - persisting ML output)
-    metadata_saved = save_metadata(metadata)
+    metadata = load_cached_metadata() if plan["skip_metadata"] else None
+    if plan["skip_metadata"] and metadata is None:
+        logger.warning("No cached metadata available; generating metadata despite the budget.")
+    if metadata is None:
+        logger.info("Generating structured project metadata using ML...")
+        metadata = generate_project_metadata(commits, count, names)
+        
+        # Save metadata to file (Task #1: taking action - persisting ML output)
+        metadata_saved = save_metadata(metadata)
     
     # Track metrics
     track_metrics(metadata, readme_success)
@@ -516,7 +1182,7 @@ if __name__ == "__main__":
         f.write(f"{readme_content}\n\n---\n\n{summary}\n")
     
     # Add metadata section to README for visibility
-    if metadata.get("ml_status") == "success":
+    if metadata.get("ml_status") in ("success", "cached"):
         metadata_section = f"\n\n## Project Metadata (AI-Generated)\n\n"
         metadata_section += f"- **Category**: {metadata.get('category', 'N/A')}\n"
         metadata_section += f"- **Type**: {metadata.get('project_type', 'N/A')}\n"
@@ -538,10 +1204,16 @@ if __name__ == "__main__":
         files_to_commit = ["README.md", "project_metadata.json"]
         commit_msg = f"docs: auto-update README and project metadata via ML\n\n- Generated metadata: {metadata.get('category', 'N/A')} project\n- Tags: {', '.join(metadata.get('tags', [])[:3])}\n- ML Status: {metadata.get('ml_status', 'unknown')}"
         
-        committed, commit_sha = auto_commit_changes(repo_path, files_to_commit, commit_msg)
+        # Metrics hold planner history; commit them only alongside a real change
+        committed, commit_sha = auto_commit_changes(repo_path, files_to_commit, commit_msg,
+                                                    extra_files=[get_metrics_file()])
         if committed:
             logger.info("Successfully auto-committed ML-generated changes (commit: %s).", commit_sha[:7] if commit_sha else "N/A")
         else:
             logger.debug("Auto-commit skipped (no changes or disabled).")
     else:
         logger.debug("Auto-commit disabled via AUTO_COMMIT=false.")
+    
+    if log_cost_filter and any(log_cost_filter.suppressed.values()):
+        logger.info("Suppressed log records: %d sampled, %d rate-limited.",
+                    log_cost_filter.suppressed["sampled"], log_cost_filter.suppressed["rate_limited"])
\ No newline at end of file
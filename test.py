@@ -1,10 +1,18 @@
 import pytest
 import os
+import logging
+import datetime
 import tempfile
 import shutil
 from unittest.mock import Mock, patch, MagicMock
 from pathlib import Path
-from prototype import count_files, parse_commit
+import git
+import prototype
+from prototype import count_files, parse_commit, content_fingerprint, auto_commit_changes
+from prototype import parse_metadata_output, validate_readme_output, complete_with_cascade, readme_max_tokens
+from prototype import LogCostFilter, StructuredFormatter, parse_debug_sampling
+from prototype import plan_run, remaining_budget, estimate_step, get_run_budgets
+from prototype import load_metrics, load_cached_metadata
 
 class TestParseCommit:
     '''
@@ -139,5 +147,393 @@ class TestCountFiles:
             count, dir_names = count_files(temp_dir)
             assert count == 0
 
+class TestContentFingerprint:
+    """
+    Test class for content_fingerprint function
+    Tests that volatile fields are ignored when hashing file content
+    """
+
+    # README footer timestamps should not affect the hash
+    def test_fingerprint_ignores_last_updated_line(self):
+        old = b"# Project\n\n---\n\ntotal files in repo: 3\nlast updated: 2025-12-11 22:22:14.259153\n"
+        new = b"# Project\n\n---\n\ntotal files in repo: 3\nlast updated: 2025-12-12 09:01:02.000001\n"
+        assert content_fingerprint(old, "README.md") == content_fingerprint(new, "README.md")
+
+    # real content changes should still change the hash
+    def test_fingerprint_detects_content_change(self):
+        old = b"# Project\n\ntotal files in repo: 3\n"
+        new = b"# Project\n\ntotal files in repo: 4\n"
+        assert content_fingerprint(old, "README.md") != content_fingerprint(new, "README.md")
+
+    # real dates in the content are not volatile and must still change the hash
+    def test_fingerprint_keeps_content_dates(self):
+        old = b"# Project\n\n## Changelog\n- Released 2025-12-01 10:00:00\n"
+        new = b"# Project\n\n## Changelog\n- Released 2025-12-12 10:00:00\n"
+        assert content_fingerprint(old, "README.md") != content_fingerprint(new, "README.md")
+
+    # metadata JSON should ignore generation timestamps, latency and history
+    def test_fingerprint_ignores_volatile_json_keys(self):
+        old = b'{"tags": ["cli"], "last_updated": "2025-12-11T00:00:00+00:00", "generation_history": []}'
+        new = b'{"generation_history": [{"timestamp": "x"}], "last_updated": "2025-12-12T00:00:00+00:00", "tags": ["cli"]}'
+        assert content_fingerprint(old, "project_metadata.json") == content_fingerprint(new, "project_metadata.json")
+
+class TestAutoCommitChanges:
+    """
+    Test class for auto_commit_changes function
+    Tests that commits are skipped when nothing meaningful changed
+    """
+
+    # Create a git repo with an initial README commit
+    @pytest.fixture
+    def test_repo(self):
+        temp_dir = tempfile.mkdtemp()
+        repo = git.Repo.init(temp_dir)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "test")
+            config.set_value("user", "email", "test@example.com")
+        readme = Path(temp_dir, "README.md")
+        readme.write_text("# Project\n\nlast updated: 2025-12-11 22:22:14\n")
+        repo.index.add(["README.md"])
+        repo.index.commit("initial commit")
+        yield temp_dir, repo, readme
+        shutil.rmtree(temp_dir)
+
+    # only the timestamp changed, so no commit should be made
+    def test_auto_commit_skips_timestamp_only_change(self, test_repo):
+        temp_dir, repo, readme = test_repo
+        readme.write_text("# Project\n\nlast updated: 2025-12-12 08:00:00\n")
+        committed, sha = auto_commit_changes(temp_dir, [str(readme)], "docs: update")
+        assert committed is False
+        assert sha is None
+        assert len(list(repo.iter_commits())) == 1
+
+    # extra files (metrics) never trigger a commit but ride along with a real change
+    def test_auto_commit_extra_files_ride_along(self, test_repo):
+        temp_dir, repo, readme = test_repo
+        metrics = Path(temp_dir, "ml_metrics.json")
+        metrics.write_text('{"total_generations": 1}')
+        committed, _ = auto_commit_changes(temp_dir, [str(readme)], "docs: update", extra_files=[str(metrics)])
+        assert committed is False
+        readme.write_text("# Project\n\nNew feature added.\n")
+        committed, _ = auto_commit_changes(temp_dir, [str(readme)], "docs: update", extra_files=[str(metrics)])
+        assert committed is True
+        assert "ml_metrics.json" in [blob.path for blob in repo.head.commit.tree.blobs]
+
+    # an extra file outside the working tree is skipped, the real change still commits
+    def test_auto_commit_extra_file_outside_repo(self, test_repo):
+        temp_dir, repo, readme = test_repo
+        with tempfile.TemporaryDirectory() as outside_dir:
+            metrics = Path(outside_dir, "ml_metrics.json")
+            metrics.write_text('{"total_generations": 1}')
+            readme.write_text("# Project\n\nNew feature added.\n")
+            committed, sha = auto_commit_changes(temp_dir, [str(readme)], "docs: update", extra_files=[str(metrics)])
+        assert committed is True
+        assert repo.head.commit.hexsha == sha
+        assert [blob.path for blob in repo.head.commit.tree.blobs] == ["README.md"]
+
+    # content changed, so a commit should be made
+    def test_auto_commit_commits_meaningful_change(self, test_repo):
+        temp_dir, repo, readme = test_repo
+        readme.write_text("# Project\n\nNew feature added.\n\nlast updated: 2025-12-12 08:00:00\n")
+        committed, sha = auto_commit_changes(temp_dir, [str(readme)], "docs: update")
+        assert committed is True
+        assert repo.head.commit.hexsha == sha
+
+class TestModelCascade:
+    """
+    Test class for the model cascade and its quality gates
+    Tests output validation and escalation to larger models
+    """
+
+    VALID_METADATA = (
+        '{"tags": ["cli"], "category": "cli-tool", "project_type": "CLI", '
+        '"tech_stack": ["Python"], "primary_language": "Python", "description": "A tool"}'
+    )
+
+    # Build a mock OpenAI client returning the given outputs in order
+    def mock_client(self, *outputs):
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            Mock(choices=[Mock(message=Mock(content=output))]) for output in outputs
+        ]
+        return client
+
+    # metadata wrapped in a markdown code block should still parse
+    def test_parse_metadata_strips_code_block(self):
+        metadata = parse_metadata_output("```json\n" + self.VALID_METADATA + "\n```")
+        assert metadata["category"] == "cli-tool"
+
+    # metadata with an unknown category should fail the quality gate
+    def test_parse_metadata_rejects_bad_schema(self):
+        with pytest.raises(ValueError):
+            parse_metadata_output(self.VALID_METADATA.replace("cli-tool", "spaceship"))
+
+    VALID_README = (
+        "# Project\n\nA tool.\n\n## Features\n- Uses `git` and ``` inline\n\n"
+        "## Installation\n```bash\npip install -r requirements.txt\n```\n"
+    )
+
+    # Reset module-level cascade and usage state around every test
+    @pytest.fixture(autouse=True)
+    def reset_state(self, monkeypatch):
+        monkeypatch.setattr(prototype, "_cascade_stats", {})
+        monkeypatch.setattr(prototype, "_run_usage", {})
+
+    # README needs a title, the required sections and balanced fence lines
+    def test_validate_readme_required_sections(self):
+        assert validate_readme_output(self.VALID_README) == self.VALID_README
+        with pytest.raises(ValueError):
+            validate_readme_output("just some text")
+        with pytest.raises(ValueError, match="setup/installation"):
+            validate_readme_output("# Project\n\n## Features\n- one\n")
+        with pytest.raises(ValueError, match="code block"):
+            validate_readme_output(self.VALID_README + "```python\nprint()\n")
+
+    # invalid output from the first tier should escalate to the next model
+    def test_cascade_escalates_on_invalid_output(self, monkeypatch):
+        monkeypatch.setenv("MODEL_CASCADE", "small,large")
+        client = self.mock_client("not json", self.VALID_METADATA)
+        with patch("prototype.get_openai_client", return_value=client):
+            metadata, model, _ = complete_with_cascade(
+                "metadata", messages=[], validate=parse_metadata_output, max_tokens=10, temperature=0
+            )
+        assert model == "large"
+        assert metadata["tags"] == ["cli"]
+        assert prototype._cascade_stats["metadata"]["small"]["hits"] == 0
+        assert prototype._cascade_stats["metadata"]["large"]["hits"] == 1
+
+    # the last tier's output is still used when it only fails the quality gate
+    def test_cascade_last_tier_falls_back_to_output(self, monkeypatch):
+        monkeypatch.setenv("MODEL_CASCADE", "small,large")
+        client = self.mock_client("plain text", "plain text from large")
+        with patch("prototype.get_openai_client", return_value=client):
+            content, model, _ = complete_with_cascade(
+                "readme", messages=[], validate=validate_readme_output, max_tokens=10, temperature=0,
+                fallback=lambda content: content,
+            )
+        assert model == "large"
+        assert content == "plain text from large"
+
+    # truncated output escalates even when it would pass the quality gate
+    def test_cascade_escalates_on_truncated_output(self, monkeypatch):
+        monkeypatch.setenv("MODEL_CASCADE", "small,large")
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            Mock(choices=[Mock(message=Mock(content=self.VALID_README), finish_reason="length")]),
+            Mock(choices=[Mock(message=Mock(content=self.VALID_README), finish_reason="stop")]),
+        ]
+        with patch("prototype.get_openai_client", return_value=client):
+            _, model, _ = complete_with_cascade(
+                "readme", messages=[], validate=validate_readme_output, max_tokens=10, temperature=0,
+                fallback=lambda content: content,
+            )
+        assert model == "large"
+        assert prototype._cascade_stats["readme"]["small"]["hits"] == 0
+
+    # a README written from scratch gets the full budget; updates scale with input
+    def test_readme_max_tokens(self):
+        commits = [f"feat: change {i}" for i in range(5)]
+        assert readme_max_tokens(commits, "") == prototype.README_MAX_TOKENS
+        assert readme_max_tokens(commits, "# Project") < prototype.README_MAX_TOKENS
+
+    # API errors on the last tier are still raised
+    def test_cascade_raises_api_error(self, monkeypatch):
+        monkeypatch.setenv("MODEL_CASCADE", "only")
+        client = MagicMock()
+        client.chat.completions.create.side_effect = RuntimeError("rate limited")
+        with patch("prototype.get_openai_client", return_value=client):
+            with pytest.raises(RuntimeError):
+                complete_with_cascade(
+                    "readme", messages=[], validate=validate_readme_output, max_tokens=10, temperature=0,
+                    fallback=lambda content: content,
+                )
+
+class TestLogCostControls:
+    """
+    Test class for logging cost controls
+    Tests DEBUG sampling, rate limiting and format-once reuse
+    """
+
+    # Build a log record for the given logger, level and message
+    def make_record(self, msg, level=logging.DEBUG, name="readme_automation", created=1000.0):
+        record = logging.LogRecord(name, level, __file__, 1, msg, (), None)
+        record.created = created
+        return record
+
+    # bare value is the default rate, name=value overrides a logger
+    def test_parse_debug_sampling(self):
+        assert parse_debug_sampling("0.5, readme_automation.git=0.1") == {"": 0.5, "readme_automation.git": 0.1}
+
+    # a 0.25 rate keeps one in four DEBUG records and leaves INFO alone
+    def test_debug_sampling(self):
+        log_filter = LogCostFilter({"readme_automation": 0.25})
+        kept = [log_filter.filter(self.make_record("scan %s")) for _ in range(8)]
+        assert kept.count(True) == 2
+        assert log_filter.filter(self.make_record("done", level=logging.INFO))
+        assert log_filter.suppressed["sampled"] == 6
+
+    # rates that are not 1/n keep the requested fraction
+    def test_debug_sampling_fractional_rates(self):
+        for rate, expected in ((0.6, 60), (0.8, 80), (0.9, 90)):
+            log_filter = LogCostFilter({"": rate})
+            kept = [log_filter.filter(self.make_record("scan %s")) for _ in range(100)]
+            assert kept.count(True) == expected
+
+    # the filter is shared by all handlers, so a record is decided and counted once
+    def test_shared_filter_counts_once(self):
+        log_filter = LogCostFilter({"": 0.0})
+        record = self.make_record("scan %s")
+        assert not log_filter.filter(record)
+        assert not log_filter.filter(record)
+        assert log_filter.suppressed["sampled"] == 1
+
+    # Reconfigure the shared logger from env, restoring the default config afterwards
+    @pytest.fixture
+    def configure(self, monkeypatch):
+        def apply(**env):
+            monkeypatch.delenv("LOGTAIL_SOURCE_TOKEN", raising=False)
+            for name, value in env.items():
+                monkeypatch.setenv(name, value)
+            prototype.configure_logging()
+            return prototype.log_cost_filter
+        yield apply
+        monkeypatch.undo()
+        prototype.configure_logging()
+
+    # per-logger sampling applies to records propagated from child loggers
+    def test_child_logger_sampling(self, configure):
+        log_filter = configure(LOG_LEVEL="DEBUG", LOG_DEBUG_SAMPLING="readme_automation.git=0")
+        logging.getLogger("readme_automation.git").debug("fetching %s", "refs")
+        assert log_filter.suppressed["sampled"] == 1
+
+    # malformed settings fall back to defaults instead of breaking import
+    def test_invalid_env_falls_back_to_defaults(self, configure):
+        log_filter = configure(LOG_DEBUG_SAMPLING="abc,readme_automation=0.5", LOG_RATE_LIMIT="5x", LOG_RATE_WINDOW="soon")
+        assert log_filter.debug_sample_rates == {"readme_automation": 0.5}
+        assert log_filter.rate_limit == 0
+        assert log_filter.rate_window == 60.0
+
+    # repeats beyond the limit are dropped until the window resets
+    def test_rate_limit_repeated_messages(self):
+        log_filter = LogCostFilter({}, rate_limit=2, rate_window=60)
+        kept = [log_filter.filter(self.make_record("retrying %s", created=1000.0 + i)) for i in range(5)]
+        assert kept == [True, True, False, False, False]
+        assert log_filter.filter(self.make_record("retrying %s", created=1100.0))
+        assert log_filter.suppressed["rate_limited"] == 3
+
+    # non-string messages are valid logging and must not break rate limiting
+    def test_rate_limit_unhashable_message(self):
+        log_filter = LogCostFilter({}, rate_limit=1, rate_window=60)
+        assert log_filter.filter(self.make_record({"a": 1}, level=logging.INFO))
+        assert not log_filter.filter(self.make_record({"a": 1}, level=logging.INFO, created=1001.0))
+
+    # tracked messages stay bounded, expired windows are pruned first
+    def test_rate_limit_tracking_is_bounded(self):
+        log_filter = LogCostFilter({}, rate_limit=1, rate_window=10)
+        log_filter.max_tracked_messages = 5
+        for i in range(20):
+            log_filter.filter(self.make_record(f"item {i}", level=logging.INFO, created=1000.0 + i))
+        assert len(log_filter._recent) <= 5
+        assert ("readme_automation", logging.INFO, "item 19") in log_filter._recent
+
+    # a shared structured formatter only renders each record once
+    def test_structured_formatter_formats_once(self):
+        formatter = StructuredFormatter()
+        record = self.make_record("hello %s", level=logging.INFO)
+        record.args = ("world",)
+        with patch.object(StructuredFormatter, "render", wraps=formatter.render) as render:
+            first = formatter.format(record)
+            second = formatter.format(record)
+        assert first == second
+        assert render.call_count == 1
+        assert record.structured_entry["message"] == "hello world"
+        assert record.structured_entry["dt"] == "1970-01-01 00:16:40 UTC"
+
+class TestRunPlanner:
+    """
+    Test class for the pre-flight run planner
+    Tests estimates from past runs, budgets and degradation order
+    """
+
+    NO_BUDGET = {"run_tokens": 0, "run_seconds": 0, "daily_tokens": 0, "daily_seconds": 0}
+    MESSAGES = [{"role": "user", "content": "hello"}]
+
+    # past runs should drive the output token and latency predictions
+    def test_estimate_uses_recorded_history(self, monkeypatch):
+        monkeypatch.setenv("MODEL_CASCADE", "gpt-4")
+        metrics = {"tasks": {"metadata": {"runs": 2, "prompt_tokens": 600, "output_tokens": 200, "latency_ms": 4000}}}
+        step = estimate_step("metadata", self.MESSAGES, 300, metrics)
+        assert step["output_tokens"] == 100
+        assert step["latency_ms"] == 2000
+        assert step["model"] == "gpt-4"
+
+    # recorded first-tier hit rates weight in the cost of escalating to the next tier
+    def test_estimate_weights_escalation(self, monkeypatch):
+        monkeypatch.setenv("MODEL_CASCADE", "gpt-4o-mini,gpt-4")
+        metrics = {
+            "tasks": {"metadata": {"runs": 4, "attempts": 4, "prompt_tokens": 0, "output_tokens": 400, "latency_ms": 4000}},
+            "cascade": {"metadata": {
+                "gpt-4o-mini": {"attempts": 4, "hits": 3, "total_latency_ms": 2000},
+                "gpt-4": {"attempts": 1, "hits": 1, "total_latency_ms": 3000},
+            }},
+        }
+        step = estimate_step("metadata", self.MESSAGES, 300, metrics)
+        assert step["escalation_rate"] == 0.25
+        assert step["output_tokens"] == 125
+        assert step["latency_ms"] == 500 + 750
+        single = estimate_step("metadata", self.MESSAGES, 300, dict(metrics, cascade={}))
+        assert step["cost_usd"] > 0.25 * single["cost_usd"]
+
+    # malformed budgets fall back to unlimited instead of crashing the run
+    def test_invalid_budget_env_is_unlimited(self, monkeypatch):
+        monkeypatch.setenv("RUN_TOKEN_BUDGET", "12k")
+        monkeypatch.setenv("DAILY_TIME_BUDGET_S", "-5")
+        budgets = get_run_budgets()
+        assert budgets["run_tokens"] == 0
+        assert budgets["daily_seconds"] == 0.0
+
+    # tokens already used today count against the daily budget
+    def test_remaining_budget_uses_daily_usage(self):
+        budgets = dict(self.NO_BUDGET, run_tokens=5000, daily_tokens=3000)
+        metrics = {"daily": {"date": datetime.date.today().isoformat(), "tokens": 2000, "latency_ms": 0}}
+        assert remaining_budget(budgets, metrics) == (1000, None)
+
+    # corrupt or non-object metrics files fall back to the empty baseline
+    def test_load_metrics_ignores_bad_files(self, tmp_path):
+        for content in ("{bad", "[1, 2]"):
+            metrics_file = tmp_path / "ml_metrics.json"
+            metrics_file.write_text(content)
+            metrics = load_metrics(str(metrics_file))
+            assert metrics["total_generations"] == 0
+            assert "tasks" not in metrics
+
+    # cached metadata must be a JSON object with tags
+    def test_load_cached_metadata_rejects_non_object(self, tmp_path):
+        metadata_file = tmp_path / "project_metadata.json"
+        metadata_file.write_text('["not", "an", "object"]')
+        assert load_cached_metadata(str(metadata_file)) is None
+        metadata_file.write_text('{"tags": ["cli"], "last_updated": "2025-12-12"}')
+        assert load_cached_metadata(str(metadata_file))["ml_status"] == "cached"
+
+    # no budget means the plan is left untouched
+    def test_plan_without_budget(self):
+        commits = [f"feat: change {i}" for i in range(50)]
+        plan = plan_run(commits, "# Project", 3, [["a.py"]], metrics={}, budgets=self.NO_BUDGET)
+        assert plan["within_budget"]
+        assert plan["degradations"] == []
+        assert set(plan["steps"]) == {"readme", "metadata"}
+
+    # a tight budget trims history first, then skips metadata and README
+    def test_plan_degrades_in_order(self):
+        commits = [f"feat: change {i}" for i in range(50)]
+        budgets = dict(self.NO_BUDGET, run_tokens=100)
+        plan = plan_run(commits, "# Project", 3, [["a.py"]], metrics={}, budgets=budgets)
+        assert len(plan["commits"]) == 10
+        assert plan["skip_metadata"] and plan["skip_readme"]
+        assert plan["degradations"][-2:] == [
+            "skipped metadata generation; reusing cached metadata",
+            "skipped README generation; reusing existing README",
+        ]
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
\ No newline at end of file